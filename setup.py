@@ -66,11 +66,13 @@ Topic :: System :: Archiving :: Backup
         'structlog>=19.1.0',
         'colorama>=0.4.1,<1',
         'diskcache>=3.0.6',
+        'orjson>=2.0.1,<4',
     ],
     extras_require={
         's3': ['boto3>=1.7.28'],
         'b2': ['b2>=1.3.2,<=1.3.8'],
         'compression': ['zstandard>=0.9.0'],
+        'xxhash': ['xxhash>=2.0.0'],
         # For RBD support the packages supplied by the Linux distribution or the Ceph team should be used,
         # possible packages names include: python-rados, python-rbd or python3-rados, python3-rbd
         #'rbd': ['rados', 'rbd'],
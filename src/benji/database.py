@@ -258,7 +258,7 @@ class BlockUid(sqlalchemy.ext.mutable.MutableComposite, StorageKeyMixIn['BlockUi
 
     def _storage_object_to_key(self) -> str:
         assert self.left is not None and self.right is not None
-        return '{:016x}-{:016x}'.format(self.left, self.right)
+        return f'{self.left:016x}-{self.right:016x}'
 
     @classmethod
     def _storage_key_to_object(cls, key: str) -> 'BlockUid':
@@ -267,6 +267,18 @@ class BlockUid(sqlalchemy.ext.mutable.MutableComposite, StorageKeyMixIn['BlockUi
                 key, (16 + 1 + 16)))
         return BlockUid(int(key[0:16], 16), int(key[17:17 + 16], 16))
 
+    # Matches the complete path including the two sharding levels in one go. This is used on the hot path when
+    # listing all blocks in a storage.
+    _STORAGE_PATH_REGEXP = re.compile(
+        re.escape(_STORAGE_PREFIX) + '[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{16})-([0-9a-f]{16})')
+
+    @classmethod
+    def storage_path_to_object(cls, path: str) -> 'BlockUid':
+        match = cls._STORAGE_PATH_REGEXP.fullmatch(path)
+        if match is None:
+            raise RuntimeError('Invalid block key name {}.'.format(path))
+        return BlockUid(int(match.group(1), 16), int(match.group(2), 16))
+
     # End: Implements StorageKeyMixIn
 
 
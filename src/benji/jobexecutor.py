@@ -1,7 +1,7 @@
 import concurrent
 from concurrent.futures import ThreadPoolExecutor, Future
 from threading import BoundedSemaphore
-from typing import List, Callable, Iterator, Any
+from typing import Set, Callable, Iterator, Any, Iterable
 
 from benji.logging import logger
 
@@ -18,36 +18,50 @@ class JobExecutor:
     def __init__(self, *, workers: int, blocking_submit: bool, name: str) -> None:
         self._name = name
         self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
-        self._futures: List[Future] = []
+        # Completed futures are removed in get_completed(), so this only holds outstanding jobs and their results.
+        # A set makes the removal O(1).
+        self._futures: Set[Future] = set()
         self._blocking_submit = blocking_submit
         # Set the queue limit to two times the number of workers plus one to ensure that there are always
         # enough jobs available even when all futures finish at the same time.
         self._semaphore = BoundedSemaphore(2 * workers + 1)
 
-    def submit(self, function: Callable) -> None:
-        if self._blocking_submit:
-            self._semaphore.acquire()
+    def _execute_with_release(self, function: Callable, *args: Any) -> Any:
+        try:
+            return function(*args)
+        finally:
+            self._semaphore.release()
 
-            def execute_with_release():
-                try:
-                    return function()
-                finally:
-                    self._semaphore.release()
+    def _execute_with_acquire(self, function: Callable, *args: Any) -> Any:
+        self._semaphore.acquire()
+        return function(*args)
 
-            self._futures.append(self._executor.submit(execute_with_release))
+    # The arguments are passed to function when the job is executed. Passing them here instead of binding them in
+    # a closure avoids allocating a new function object for every job.
+    def submit(self, function: Callable, *args: Any) -> None:
+        if self._blocking_submit:
+            self._semaphore.acquire()
+            self._futures.add(self._executor.submit(self._execute_with_release, function, *args))
         else:
+            self._futures.add(self._executor.submit(self._execute_with_acquire, function, *args))
 
-            def execute_with_acquire():
-                self._semaphore.acquire()
-                return function()
-
-            self._futures.append(self._executor.submit(execute_with_acquire))
+    # Executes function for each element of arguments on the executor's workers, the results are returned in the
+    # order of completion. Exceptions are propagated to the caller. This is independent of submit() and
+    # get_completed().
+    def map_unordered(self, function: Callable, arguments: Iterable[Any]) -> Iterator[Any]:
+        futures = [self._executor.submit(function, argument) for argument in arguments]
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
 
     # This is tricky to implement as we need to make sure that we don't hold a reference to the completed Future anymore.
     # Indeed it's so tricky that older Python versions had the same problem. See https://bugs.python.org/issue27144.
     def get_completed(self, timeout: int = None) -> Iterator[Any]:
         for future in concurrent.futures.as_completed(self._futures, timeout=timeout):
-            self._futures.remove(future)
+            self._futures.discard(future)
             if not self._blocking_submit and not future.cancelled():
                 self._semaphore.release()
             try:
@@ -61,7 +75,7 @@ class JobExecutor:
         if len(self._futures) > 0:
             logger.warning('Job executor "{}" is being shutdown with {} outstanding jobs, cancelling them.'.format(
                 self._name, len(self._futures)))
-            for future in self._futures:
+            for future in list(self._futures):
                 future.cancel()
             logger.debug('Job executor "{}" cancelled all outstanding jobs.'.format(self._name))
             if not self._blocking_submit:
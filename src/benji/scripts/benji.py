@@ -3,6 +3,7 @@
 # PYTHON_ARGCOMPLETE_OK
 
 import argparse
+import multiprocessing
 import os
 import sys
 from functools import partial
@@ -41,6 +42,10 @@ def integer_range(minimum: int, maximum: int, arg: str) -> Optional[int]:
 
 
 def main():
+    # Storage transform workers are started with the spawn method. In a frozen executable (see pyinstaller/) the
+    # workers run this executable and must be diverted here instead of executing the command line interface.
+    multiprocessing.freeze_support()
+
     if sys.hexversion < 0x030605F0:
         # We're using features introduced with Python 3.6. In addition Python versions before 3.6.5 have some
         # shortcomings in the concurrent.futures implementation which lead to an excessive memory usage.
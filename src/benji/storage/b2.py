@@ -1,9 +1,10 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
+import hashlib
 import logging
 import random
 import time
-from typing import Any, Union, Iterable, Tuple
+from typing import Any, Union, Iterable, Tuple, Sequence, List
 
 import b2
 import b2.api
@@ -24,6 +25,8 @@ class Storage(ReadCacheStorageBase):
     WRITE_QUEUE_LENGTH = 20
     READ_QUEUE_LENGTH = 20
 
+    _CONCURRENT_OBJECT_PAIR_READS = True
+
     def __init__(self, *, config: Config, name: str, module_configuration: ConfigDict):
         super().__init__(config=config, name=name, module_configuration=module_configuration)
 
@@ -114,7 +117,7 @@ class Storage(ReadCacheStorageBase):
 
         raise FileNotFoundError('Object {} not found.'.format(key))
 
-    def _read_object_length(self, key: str) -> int:
+    def _file_info_with_retries(self, key: str) -> Any:
         for i in range(self._read_object_attempts):
             try:
                 file_version_info = self._file_info(key)
@@ -124,16 +127,30 @@ class Storage(ReadCacheStorageBase):
                 else:
                     if i + 1 < self._read_object_attempts:
                         sleep_time = (2**(i + 1)) + (random.randint(0, 1000) / 1000)
-                        logger.warning(
-                            'Object length request for key {} to B2 failed, will try again in {:.2f} seconds.'.format(
-                                key, sleep_time))
+                        logger.warning('File info request for key {} to B2 failed, retrying in {:.2f} seconds.'.format(
+                            key, sleep_time))
                         time.sleep(sleep_time)
                         continue
                     raise
             else:
                 break
 
-        return file_version_info.size
+        return file_version_info
+
+    def _read_object_length(self, key: str) -> int:
+        return self._file_info_with_retries(key).size
+
+    def _compare_object(self, key: str, data_expected: bytes) -> bool:
+        file_version_info = self._file_info_with_retries(key)
+
+        if file_version_info.size != len(data_expected):
+            return False
+
+        # B2 records the SHA1 digest of the content for objects uploaded in one part
+        if file_version_info.content_sha1 == hashlib.sha1(data_expected).hexdigest():
+            return True
+
+        return super()._compare_object(key, data_expected)
 
     def _rm_object(self, key: str) -> None:
         try:
@@ -145,22 +162,26 @@ class Storage(ReadCacheStorageBase):
             else:
                 raise
 
-    # def _rm_many_objects(self, keys: Sequence[str]) -> List[str]:
-    #     """ Deletes many keys from the storage and returns a list of keys that couldn't be deleted.
-    #     """
-    #     errors = []
-    #     for key in keys:
-    #         try:
-    #             file_version_info = self._file_info(key)
-    #             self.bucket.delete_file_version(file_version_info.id_, file_version_info.file_name)
-    #         except (B2Error, FileNotFoundError):
-    #             errors.append(key)
-    #     return errors
-
-    def _list_objects(self, prefix: str = None,
-                      include_size: bool = False) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
+    def _rm_many_objects(self, keys: Sequence[str]) -> List[str]:
+        """ Deletes many keys from the storage and returns a list of keys that couldn't be deleted.
+        """
+        errors = []
+        for key in keys:
+            try:
+                file_version_info = self._file_info(key)
+                self.bucket.delete_file_version(file_version_info.id_, file_version_info.file_name)
+            except (B2Error, FileNotFoundError):
+                errors.append(key)
+        return errors
+
+    def _list_objects(self,
+                      prefix: str = None,
+                      include_size: bool = False,
+                      exclude_suffix: str = None) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
         for file_version_info, folder_name in self.bucket.find_versions(folder_to_list=prefix if prefix is not None else '',
                                                                         recursive=True):
+            if exclude_suffix is not None and file_version_info.file_name.endswith(exclude_suffix):
+                continue
             if include_size:
                 yield file_version_info.file_name, file_version_info.size
             else:
@@ -2,13 +2,19 @@
 # -*- encoding: utf-8 -*-
 import base64
 import datetime
-import json
+import itertools
+import multiprocessing
 import os
+import random
+import sys
 import threading
 import time
 from abc import ABCMeta, abstractmethod
-from typing import Union, Optional, Dict, Tuple, List, Sequence, cast, Iterator, Iterable
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from functools import lru_cache
+from typing import Union, Optional, Dict, Tuple, List, Sequence, cast, Iterator, Iterable, AbstractSet
 
+import orjson
 import semantic_version
 from diskcache import FanoutCache
 
@@ -19,9 +25,10 @@ from benji.jobexecutor import JobExecutor
 from benji.logging import logger
 from benji.repr import ReprMixIn
 from benji.storage.dicthmac import DictHMAC
+from benji.storage.key import SHARDING_HASHES
 from benji.transform.base import TransformBase
 from benji.transform.factory import TransformFactory
-from benji.utils import TokenBucket, derive_key
+from benji.utils import BlockingTokenBucket, derive_key
 from benji.versions import VERSIONS
 
 
@@ -49,19 +56,43 @@ class BlockNotFoundError(BenjiException, IOError):
         return self._uid
 
 
+# There are only a handful of different object metadata versions, so parse and check each of them only once
+@lru_cache(maxsize=16)
+def _object_metadata_version_supported(version: str) -> bool:
+    return semantic_version.Version(version) in VERSIONS.object_metadata.supported
+
+
 class StorageBase(ReprMixIn, metaclass=ABCMeta):
 
-    _CHECKSUM_KEY = 'checksum'
-    _CREATED_KEY = 'created'
-    _MODIFIED_KEY = 'modified'
-    _HMAC_KEY = 'hmac'
-    _METADATA_VERSION_KEY = 'metadata_version'
-    _OBJECT_SIZE_KEY = 'object_size'
-    _SIZE_KEY = 'size'
-    _TRANSFORMS_KEY = 'transforms'
+    # These are used as dictionary keys for every block read and written
+    _CHECKSUM_KEY = sys.intern('checksum')
+    _CREATED_KEY = sys.intern('created')
+    _MODIFIED_KEY = sys.intern('modified')
+    _HMAC_KEY = sys.intern('hmac')
+    _METADATA_VERSION_KEY = sys.intern('metadata_version')
+    _OBJECT_SIZE_KEY = sys.intern('object_size')
+    _SIZE_KEY = sys.intern('size')
+    _TRANSFORMS_KEY = sys.intern('transforms')
+
+    _REQUIRED_METADATA_KEYS = frozenset((_CREATED_KEY, _MODIFIED_KEY, _OBJECT_SIZE_KEY, _SIZE_KEY))
 
     _META_SUFFIX = '.meta'
 
+    _METADATA_VERSION = str(VERSIONS.object_metadata.current)
+    # Version 3.0.0 only changed the format of the HMAC. Object metadata without a HMAC is still written as version
+    # 2.0.0, so that it stays readable by older versions of Benji.
+    _METADATA_VERSION_WITHOUT_HMAC = '2.0.0'
+
+    # Number of keys passed to one _rm_many_objects() call, this matches the limit of S3's DeleteObjects
+    _RM_MANY_OBJECTS_CHUNK_SIZE = 1000
+
+    # Storage modules for remote object stores can set this to read the data and metadata objects of a block
+    # concurrently, so that the latency of the two requests overlaps.
+    _CONCURRENT_OBJECT_PAIR_READS = False
+
+    # Transforming smaller objects in a worker process costs more than it gains
+    _TRANSFORM_WORKER_MINIMUM_SIZE = 64 * 1024
+
     def __init__(self, *, config: Config, name: str, module_configuration: ConfigDict) -> None:
         self._name = name
         self._active_transforms: List[TransformBase] = []
@@ -73,6 +104,7 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
             logger.info('Active transforms for storage {}: {}.'.format(
                 name,
                 ', '.join('{} ({})'.format(transform.name, transform.module) for transform in self._active_transforms)))
+        self._active_transform_names = [transform.name for transform in self._active_transforms]
 
         simultaneous_writes = Config.get_from_dict(module_configuration, 'simultaneousWrites', types=int)
         simultaneous_reads = Config.get_from_dict(module_configuration, 'simultaneousReads', types=int)
@@ -80,10 +112,21 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         bandwidth_read = Config.get_from_dict(module_configuration, 'bandwidthRead', types=int)
         bandwidth_write = Config.get_from_dict(module_configuration, 'bandwidthWrite', types=int)
 
+        self._sharding_hash = Config.get_from_dict(module_configuration, 'shardingHash', types=str)
+        if self._sharding_hash not in SHARDING_HASHES:
+            raise ConfigurationError('Sharding hash {} is not available for storage {}, supported are: {}.'.format(
+                self._sharding_hash, name, ', '.join(SHARDING_HASHES.keys())))
+
         self._consistency_check_writes = Config.get_from_dict(module_configuration,
                                                               'consistencyCheckWrites',
                                                               False,
                                                               types=bool)
+        self._consistency_check_writes_sample = Config.get_from_dict(module_configuration,
+                                                                     'consistencyCheckWritesSample',
+                                                                     types=(int, float))
+        self._consistency_check_writes_minimum_size = Config.get_from_dict(module_configuration,
+                                                                           'consistencyCheckWritesMinimumSize',
+                                                                           types=int)
 
         hmac_key_encoded = Config.get_from_dict(module_configuration, 'hmac.key', None, types=str)
         hmac_key: Optional[bytes] = None
@@ -102,15 +145,45 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         if hmac_key is not None:
             logger.info('Enabling HMAC object metadata integrity protection for storage {}.'.format(name))
             self._dict_hmac = DictHMAC(hmac_key=self._HMAC_KEY, secret_key=hmac_key)
-
-        self.read_throttling = TokenBucket()
-        self.read_throttling.set_rate(bandwidth_read)  # 0 disables throttling
-        self.write_throttling = TokenBucket()
-        self.write_throttling.set_rate(bandwidth_write)  # 0 disables throttling
+        self._metadata_version = self._METADATA_VERSION if self._dict_hmac else self._METADATA_VERSION_WITHOUT_HMAC
+
+        self._read_bucket = BlockingTokenBucket()
+        self._read_bucket.set_rate(bandwidth_read)  # 0 disables throttling
+        self._write_bucket = BlockingTokenBucket()
+        self._write_bucket.set_rate(bandwidth_write)  # 0 disables throttling
+        # Avoid taking the bucket locks at all when throttling is disabled
+        self._read_throttled = bandwidth_read > 0
+        self._write_throttled = bandwidth_write > 0
+
+        transform_workers = Config.get_from_dict(module_configuration, 'transformWorkers', types=int)
+        self._transform_executor: Optional[ProcessPoolExecutor] = None
+        if transform_workers > 0:
+            logger.info('Using {} worker processes for transforms in storage {}.'.format(transform_workers, name))
+            if sys.version_info >= (3, 7):
+                # The workers are spawned explicitly so that they don't depend on the platform's default start method
+                # and are safe to start while other threads are running. They configure TransformFactory themselves.
+                self._transform_executor = ProcessPoolExecutor(max_workers=transform_workers,
+                                                               mp_context=multiprocessing.get_context('spawn'),
+                                                               initializer=_transform_worker_initialize,
+                                                               initargs=(config,))
+            else:
+                # Python 3.6 always uses the default start method which is fork on the supported platforms. The workers
+                # inherit the configuration of TransformFactory. All of them are started here before any threads of
+                # this storage exist.
+                self._transform_executor = ProcessPoolExecutor(max_workers=transform_workers)
+                self._transform_executor.submit(_transform_worker_initialize, None).result()
 
         self._read_executor = JobExecutor(name='Storage-Read', workers=simultaneous_reads, blocking_submit=False)
+        self._metadata_read_executor: Optional[ThreadPoolExecutor] = None
+        if self._CONCURRENT_OBJECT_PAIR_READS:
+            self._metadata_read_executor = ThreadPoolExecutor(max_workers=simultaneous_reads,
+                                                              thread_name_prefix='Storage-Read-Metadata')
         self._write_executor = JobExecutor(name='Storage-Write', workers=simultaneous_writes, blocking_submit=True)
         self._remove_executor = JobExecutor(name='Storage-Remove', workers=simultaneous_removals, blocking_submit=True)
+        # Write checks of asynchronous writes are performed in the background, so that they don't delay the writes
+        self._check_executor: Optional[JobExecutor] = None
+        if self._consistency_check_writes:
+            self._check_executor = JobExecutor(name='Storage-Check', workers=simultaneous_writes, blocking_submit=True)
 
     @property
     def name(self) -> str:
@@ -126,7 +199,7 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         timestamp = datetime.datetime.utcnow().isoformat(timespec='microseconds') + 'Z'
         metadata: Dict = {
             self._CREATED_KEY: timestamp,
-            self._METADATA_VERSION_KEY: str(VERSIONS.object_metadata.current),
+            self._METADATA_VERSION_KEY: self._metadata_version,
             self._MODIFIED_KEY: timestamp,
             self._OBJECT_SIZE_KEY: object_size,
             self._SIZE_KEY: size,
@@ -138,28 +211,30 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         if transforms_metadata:
             metadata[self._TRANSFORMS_KEY] = transforms_metadata
 
+        metadata_json = orjson.dumps(metadata)
         if self._dict_hmac:
-            self._dict_hmac.add_digest(metadata)
+            metadata_json = self._dict_hmac.add_digest_serialized(metadata_json)
 
-        return metadata, json.dumps(metadata, separators=(',', ':')).encode('utf-8')
+        return metadata, metadata_json
 
     def _decode_metadata(self, *, metadata_json: bytes, key: str, data_length: int) -> Dict:
-        metadata = json.loads(metadata_json.decode('utf-8'))
-
         if self._dict_hmac:
-            self._dict_hmac.verify_digest(metadata)
+            metadata = self._dict_hmac.verify_digest_serialized(metadata_json)
+        else:
+            metadata = orjson.loads(metadata_json)
 
         # We currently support only one object metadata version
         if self._METADATA_VERSION_KEY not in metadata:
             raise KeyError('Required object metadata key {} is missing for object {}.'.format(
                 self._METADATA_VERSION_KEY, key))
-        version_obj = semantic_version.Version(metadata[self._METADATA_VERSION_KEY])
-        if version_obj not in VERSIONS.object_metadata.supported:
-            raise ValueError('Unsupported object metadata version: "{}".'.format(str(version_obj)))
+        if not _object_metadata_version_supported(metadata[self._METADATA_VERSION_KEY]):
+            raise ValueError('Unsupported object metadata version: "{}".'.format(metadata[self._METADATA_VERSION_KEY]))
 
-        for required_key in [self._CREATED_KEY, self._MODIFIED_KEY, self._OBJECT_SIZE_KEY, self._SIZE_KEY]:
-            if required_key not in metadata:
-                raise KeyError('Required object metadata key {} is missing for object {}.'.format(required_key, key))
+        if not self._REQUIRED_METADATA_KEYS.issubset(metadata):
+            missing_key = next(required_key for required_key in (self._CREATED_KEY, self._MODIFIED_KEY,
+                                                                 self._OBJECT_SIZE_KEY, self._SIZE_KEY)
+                               if required_key not in metadata)
+            raise KeyError('Required object metadata key {} is missing for object {}.'.format(missing_key, key))
 
         if data_length != metadata[self._OBJECT_SIZE_KEY]:
             raise ValueError('Length mismatch for object {}. Expected: {}, got: {}.'.format(
@@ -168,28 +243,42 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         return metadata
 
     def _check_write(self, *, key: str, metadata_key: str, data_expected: bytes) -> None:
-        data_actual = self._read_object(key)
+        # Comparing encapsulated data here
+        if not self._compare_object(key, data_expected):
+            raise ValueError('Written and read data of {} differ.'.format(key))
+
         metadata_actual_json = self._read_object(metadata_key)
+        # Return value is ignored, the object's length is equal to the expected length at this point
+        self._decode_metadata(metadata_json=metadata_actual_json, key=key, data_length=len(data_expected))
 
-        # Return value is ignored
-        self._decode_metadata(metadata_json=metadata_actual_json, key=key, data_length=len(data_actual))
+    def _check_write_wanted(self, object_size: int) -> bool:
+        return (self._consistency_check_writes and object_size >= self._consistency_check_writes_minimum_size and
+                (self._consistency_check_writes_sample >= 1 or random.random() < self._consistency_check_writes_sample))
 
-        # Comparing encapsulated data here
-        if data_expected != data_actual:
-            raise ValueError('Written and read data of {} differ.'.format(key))
+    def _check_block_write(self, block: DereferencedBlock, key: str, metadata_key: str,
+                           data_expected: bytes) -> DereferencedBlock:
+        try:
+            self._check_write(key=key, metadata_key=metadata_key, data_expected=data_expected)
+        except (KeyError, ValueError) as exception:
+            raise InvalidBlockException('Check write of block {} (UID {}) failed.'.format(block.idx, block.uid),
+                                        block) from exception
+        return block
 
-    def _write(self, block: DereferencedBlock, data: bytes) -> DereferencedBlock:
-        data, transforms_metadata = self._encapsulate(data)
+    # When the write is checked asynchronously None is returned and the block is only reported as written by the
+    # check job after the check has succeeded.
+    def _write(self, block: DereferencedBlock, data: bytes, check_async: bool = False) -> Optional[DereferencedBlock]:
+        data, transforms_metadata = self._encapsulate_block(data)
 
         metadata, metadata_json = self._build_metadata(size=block.size,
                                                        object_size=len(data),
                                                        checksum=block.checksum,
                                                        transforms_metadata=transforms_metadata)
 
-        key = block.uid.storage_object_to_path()
+        key = block.uid.storage_object_to_path(self._sharding_hash)
         metadata_key = key + self._META_SUFFIX
 
-        time.sleep(self.write_throttling.consume(len(data) + len(metadata_json)))
+        if self._write_throttled:
+            self._write_bucket.acquire(len(data) + len(metadata_json))
         t1 = time.time()
         try:
             self._write_object(key, data)
@@ -205,45 +294,64 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
 
         logger.debug('{} wrote data of uid {} in {:.3f}s'.format(threading.current_thread().name, block.uid, t2 - t1))
 
-        if self._consistency_check_writes:
-            try:
-                self._check_write(key=key, metadata_key=metadata_key, data_expected=data)
-            except (KeyError, ValueError) as exception:
-                raise InvalidBlockException('Check write of block {} (UID {}) failed.'.format(block.idx, block.uid),
-                                            block) from exception
+        if self._check_write_wanted(len(data)):
+            if check_async:
+                assert self._check_executor is not None
+                self._check_executor.submit(self._check_block_write, block, key, metadata_key, data)
+                return None
+            else:
+                self._check_block_write(block, key, metadata_key, data)
 
         return block
 
     def write_block_async(self, block: Union[DereferencedBlock, Block], data: bytes) -> None:
-        # We do need to dereference the block outside of the closure otherwise a reference to the block will be held
-        # inside of the closure leading to database troubles.
+        # We do need to dereference the block before submitting the job otherwise a reference to the block will be
+        # held by the job leading to database troubles.
         # See https://github.com/elemental-lf/benji/issues/61.
-        block_deref = block.deref()
-
-        def job():
-            return self._write(block_deref, data)
-
-        self._write_executor.submit(job)
+        self._write_executor.submit(self._write, block.deref(), data, True)
 
     def write_block(self, block: Union[DereferencedBlock, Block], data: bytes) -> None:
         self._write(block.deref(), data)
 
+    def _write_get_completed_unchecked(self,
+                                       timeout: Optional[int]) -> Iterator[Union[DereferencedBlock, BaseException]]:
+        for result in self._write_executor.get_completed(timeout=timeout):
+            if result is not None:
+                yield result
+
+    # Writes which are checked asynchronously are reported by the check job, so that a block is never reported
+    # as written before its check has succeeded.
     def write_get_completed(self, timeout: int = None) -> Iterator[Union[DereferencedBlock, BaseException]]:
-        return self._write_executor.get_completed(timeout=timeout)
+        if self._check_executor is None:
+            yield from self._write_executor.get_completed(timeout=timeout)
+        elif timeout is None:
+            # All writes need to finish first as they submit the checks
+            yield from self._write_get_completed_unchecked(None)
+            yield from self._check_executor.get_completed()
+        else:
+            try:
+                yield from self._check_executor.get_completed(timeout=0)
+            except TimeoutError:
+                pass
+            yield from self._write_get_completed_unchecked(timeout)
 
     def _read(self, block: DereferencedBlock, metadata_only: bool) -> Tuple[DereferencedBlock, Optional[bytes], Dict]:
-        key = block.uid.storage_object_to_path()
-        metadata_key = key + self._META_SUFFIX
+        key = block.uid.storage_object_to_path(self._sharding_hash)
+        return self._read_keys(block, key, key + self._META_SUFFIX, metadata_only)
+
+    def _read_keys(self, block: DereferencedBlock, key: str, metadata_key: str,
+                   metadata_only: bool) -> Tuple[DereferencedBlock, Optional[bytes], Dict]:
         data: Optional[bytes] = None
         try:
             t1 = time.time()
             if not metadata_only:
-                data = self._read_object(key)
+                data, metadata_json = self._read_object_pair(key, metadata_key)
                 data_length = len(data)
             else:
                 data_length = self._read_object_length(key)
-            metadata_json = self._read_object(metadata_key)
-            time.sleep(self.read_throttling.consume(len(data) if data else 0 + len(metadata_json)))
+                metadata_json = self._read_object(metadata_key)
+            if self._read_throttled:
+                self._read_bucket.acquire((len(data) if data is not None else 0) + len(metadata_json))
             t2 = time.time()
         except FileNotFoundError as exception:
             raise InvalidBlockException(
@@ -262,7 +370,7 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
                     self._CHECKSUM_KEY, block.idx, block.uid), block)
 
         if not metadata_only and self._TRANSFORMS_KEY in metadata:
-            data = self._decapsulate(data, metadata[self._TRANSFORMS_KEY])  # type: ignore
+            data = self._decapsulate_block(data, metadata[self._TRANSFORMS_KEY])  # type: ignore
 
         logger.debug('{} read data of uid {} in {:.3f}s{}'.format(threading.current_thread().name, block.uid, t2 - t1,
                                                                   ' (metadata only)' if metadata_only else ''))
@@ -270,15 +378,10 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         return block, data, metadata
 
     def read_block_async(self, block: Block, metadata_only: bool = False) -> None:
-        # We do need to dereference the block outside of the closure otherwise a reference to the block will be held
-        # inside of the closure leading to database troubles.
+        # We do need to dereference the block before submitting the job otherwise a reference to the block will be
+        # held by the job leading to database troubles.
         # See https://github.com/elemental-lf/benji/issues/61.
-        block_deref = block.deref()
-
-        def job():
-            return self._read(block_deref, metadata_only)
-
-        self._read_executor.submit(job)
+        self._read_executor.submit(self._read, block.deref(), metadata_only)
 
     def read_block(self, block: Block, metadata_only: bool = False) -> Optional[bytes]:
         return self._read(block.deref(), metadata_only)[1]
@@ -306,7 +409,7 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
                                  metadata[self._CHECKSUM_KEY][:16]))
 
     def _rm_block(self, uid: BlockUid) -> BlockUid:
-        key = uid.storage_object_to_path()
+        key = uid.storage_object_to_path(self._sharding_hash)
         metadata_key = key + self._META_SUFFIX
         try:
             self._rm_object(key)
@@ -320,11 +423,7 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         return uid
 
     def rm_block_async(self, uid: BlockUid) -> None:
-
-        def job():
-            return self._rm_block(uid)
-
-        self._remove_executor.submit(job)
+        self._remove_executor.submit(self._rm_block, uid)
 
     def rm_block(self, uid: BlockUid) -> None:
         self._rm_block(uid)
@@ -335,20 +434,30 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
     def wait_rms_finished(self):
         self._remove_executor.wait_for_all()
 
-    # def rm_many_blocks(self, uids: Union[Sequence[BlockUid], AbstractSet[BlockUid]]) -> List[BlockUid]:
-    #     keys = [uid.storage_object_to_path() for uid in uids]
-    #     metadata_keys = [key + self._META_SUFFIX for key in keys]
-    #
-    #     errors = self._rm_many_objects(keys)
-    #     self._rm_many_objects(metadata_keys)
-    #     return [cast(BlockUid, BlockUid.storage_path_to_object(error)) for error in errors]
+    # Returns the UIDs of the blocks whose data objects couldn't be removed. See _rm_many_objects() on whether
+    # missing blocks are included.
+    def rm_many_blocks(self, uids: Union[Sequence[BlockUid], AbstractSet[BlockUid]]) -> List[BlockUid]:
+        keys = [uid.storage_object_to_path(self._sharding_hash) for uid in uids]
+        metadata_keys = [key + self._META_SUFFIX for key in keys]
+
+        # Data and metadata objects are removed together in chunks which are processed concurrently by the removal
+        # workers. Metadata objects which couldn't be removed are only logged.
+        all_keys = keys + metadata_keys
+        chunk_size = self._RM_MANY_OBJECTS_CHUNK_SIZE
+        chunks = [all_keys[i:i + chunk_size] for i in range(0, len(all_keys), chunk_size)]
+        errors = itertools.chain.from_iterable(self._remove_executor.map_unordered(self._rm_many_objects, chunks))
+        failed_uids = []
+        for error in errors:
+            if error.endswith(self._META_SUFFIX):
+                logger.warning('Unable to remove object metadata of block UID {} from storage {}.'.format(
+                    BlockUid.storage_path_to_object(error[:-len(self._META_SUFFIX)]), self.name))
+            else:
+                failed_uids.append(cast(BlockUid, BlockUid.storage_path_to_object(error)))
+        return failed_uids
 
     def list_blocks(self) -> Iterable[BlockUid]:
-        keys = self._list_objects(BlockUid.storage_prefix())
+        keys = cast(Iterable[str], self._list_objects(BlockUid.storage_prefix(), exclude_suffix=self._META_SUFFIX))
         for key in keys:
-            assert isinstance(key, str)
-            if key.endswith(self._META_SUFFIX):
-                continue
             try:
                 yield BlockUid.storage_path_to_object(key)
             except (RuntimeError, ValueError):
@@ -356,11 +465,8 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
                 pass
 
     def list_versions(self) -> Iterable[VersionUid]:
-        keys = self._list_objects(VersionUid.storage_prefix())
+        keys = cast(Iterable[str], self._list_objects(VersionUid.storage_prefix(), exclude_suffix=self._META_SUFFIX))
         for key in keys:
-            assert isinstance(key, str)
-            if key.endswith(self._META_SUFFIX):
-                continue
             try:
                 yield VersionUid.storage_path_to_object(key)
             except (RuntimeError, ValueError):
@@ -368,10 +474,9 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
                 pass
 
     def read_version(self, version_uid: VersionUid) -> str:
-        key = version_uid.storage_object_to_path()
+        key = version_uid.storage_object_to_path(self._sharding_hash)
         metadata_key = key + self._META_SUFFIX
-        data = self._read_object(key)
-        metadata_json = self._read_object(metadata_key)
+        data, metadata_json = self._read_object_pair(key, metadata_key)
 
         metadata = self._decode_metadata(metadata_json=metadata_json, key=key, data_length=len(data))
 
@@ -385,7 +490,7 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         return data.decode('utf-8')
 
     def write_version(self, version_uid: VersionUid, data: str, overwrite: Optional[bool] = False) -> None:
-        key = version_uid.storage_object_to_path()
+        key = version_uid.storage_object_to_path(self._sharding_hash)
         metadata_key = key + self._META_SUFFIX
 
         if not overwrite:
@@ -419,7 +524,7 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
             self._check_write(key=key, metadata_key=metadata_key, data_expected=data_bytes)
 
     def rm_version(self, version_uid: VersionUid) -> None:
-        key = version_uid.storage_object_to_path()
+        key = version_uid.storage_object_to_path(self._sharding_hash)
         metadata_key = key + self._META_SUFFIX
         try:
             self._rm_object(key)
@@ -438,20 +543,21 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
         return objects_count, objects_size
 
     def _encapsulate(self, data: bytes) -> Tuple[bytes, List]:
-        if self._active_transforms is not None:
-            transforms_metadata = []
-            for transform in self._active_transforms:
-                data_encapsulated, materials = transform.encapsulate(data=data)
-                if data_encapsulated:
-                    transforms_metadata.append({
-                        'name': transform.name,
-                        'module': transform.module,
-                        'materials': materials,
-                    })
-                    data = data_encapsulated
-            return data, transforms_metadata
-        else:
-            return data, []
+        return self._encapsulate_with(self._active_transforms, data)
+
+    @staticmethod
+    def _encapsulate_with(transforms: Sequence[TransformBase], data: bytes) -> Tuple[bytes, List]:
+        transforms_metadata = []
+        for transform in transforms:
+            data_encapsulated, materials = transform.encapsulate(data=data)
+            if data_encapsulated:
+                transforms_metadata.append({
+                    'name': transform.name,
+                    'module': transform.module,
+                    'materials': materials,
+                })
+                data = data_encapsulated
+        return data, transforms_metadata
 
     @staticmethod
     def _decapsulate(data: bytes, transforms_metadata: Sequence[Dict]) -> bytes:
@@ -469,8 +575,26 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
                 raise IOError('Unknown transform {} in object metadata.'.format(name))
         return data
 
+    # Block data is transformed in a worker process when configured to spread CPU bound transforms over multiple
+    # cores. Only the names of the transforms are sent to the worker.
+    def _encapsulate_block(self, data: bytes) -> Tuple[bytes, List]:
+        if not self._active_transforms:
+            return data, []
+        elif self._transform_executor is not None and len(data) >= self._TRANSFORM_WORKER_MINIMUM_SIZE:
+            return self._transform_executor.submit(_encapsulate_worker, self._active_transform_names, data).result()
+        else:
+            return self._encapsulate(data)
+
+    def _decapsulate_block(self, data: bytes, transforms_metadata: Sequence[Dict]) -> bytes:
+        if self._transform_executor is not None and len(data) >= self._TRANSFORM_WORKER_MINIMUM_SIZE:
+            return self._transform_executor.submit(_decapsulate_worker, data, transforms_metadata).result()
+        else:
+            return self._decapsulate(data, transforms_metadata)
+
     def wait_writes_finished(self) -> None:
         self._write_executor.wait_for_all()
+        if self._check_executor is not None:
+            self._check_executor.wait_for_all()
 
     def use_read_cache(self, enable: bool) -> bool:
         return False
@@ -478,7 +602,13 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
     def close(self) -> None:
         self._read_executor.shutdown()
         self._write_executor.shutdown()
+        if self._check_executor is not None:
+            self._check_executor.shutdown()
         self._remove_executor.shutdown()
+        if self._metadata_read_executor is not None:
+            self._metadata_read_executor.shutdown()
+        if self._transform_executor is not None:
+            self._transform_executor.shutdown()
 
     @abstractmethod
     def _write_object(self, key: str, data: bytes):
@@ -492,17 +622,66 @@ class StorageBase(ReprMixIn, metaclass=ABCMeta):
     def _read_object_length(self, key: str) -> int:
         raise NotImplementedError
 
+    def _read_object_pair(self, key: str, metadata_key: str) -> Tuple[bytes, bytes]:
+        if self._metadata_read_executor is None:
+            return self._read_object(key), self._read_object(metadata_key)
+
+        metadata_future = self._metadata_read_executor.submit(self._read_object, metadata_key)
+        try:
+            data = self._read_object(key)
+        except:
+            # The metadata read is either cancelled or its result is discarded
+            metadata_future.cancel()
+            raise
+        return data, metadata_future.result()
+
+    def _compare_object(self, key: str, data_expected: bytes) -> bool:
+        """ Returns True if the object's content is equal to data_expected. Storage modules can override this to
+        avoid reading the whole object into memory, for example by comparing a content hash supplied by the backend.
+        """
+        return self._read_object(key) == data_expected
+
     @abstractmethod
     def _rm_object(self, key: str) -> None:
         raise NotImplementedError
 
+    def _rm_many_objects(self, keys: Sequence[str]) -> List[str]:
+        """ Deletes many keys from the storage and returns a list of keys that couldn't be deleted. This includes
+        keys which don't exist unless the storage can't detect this efficiently. S3 for example reports the deletion
+        of a non-existent key as successful, so such keys are not returned by the s3 module.
+        """
+        errors = []
+        for key in keys:
+            try:
+                self._rm_object(key)
+            except FileNotFoundError:
+                errors.append(key)
+        return errors
+
     @abstractmethod
     def _list_objects(self,
                       prefix: str = None,
-                      include_size: bool = False) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
+                      include_size: bool = False,
+                      exclude_suffix: str = None) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
         raise NotImplementedError
 
 
+# These functions are executed in the transform worker processes. Transform instances which haven't been inherited
+# from the parent process are created on first use.
+def _transform_worker_initialize(config: Optional[Config]) -> None:
+    # Without a configuration the worker was forked and has inherited the configuration of TransformFactory
+    if config is not None:
+        TransformFactory.initialize(config)
+
+
+def _encapsulate_worker(transform_names: Sequence[str], data: bytes) -> Tuple[bytes, List]:
+    return StorageBase._encapsulate_with([TransformFactory.get_by_name(name) for name in transform_names], data)
+
+
+def _decapsulate_worker(data: bytes, transforms_metadata: Sequence[Dict]) -> bytes:
+    return StorageBase._decapsulate(data, transforms_metadata)
+
+
 class ReadCacheStorageBase(StorageBase):
 
     def __init__(self, *, config: Config, name: str, module_configuration: ConfigDict) -> None:
@@ -534,7 +713,7 @@ class ReadCacheStorageBase(StorageBase):
         super().__init__(config=config, name=name, module_configuration=module_configuration)
 
     def _read(self, block: DereferencedBlock, metadata_only: bool) -> Tuple[DereferencedBlock, Optional[bytes], Dict]:
-        key = block.uid.storage_object_to_path()
+        key = block.uid.storage_object_to_path(self._sharding_hash)
         metadata_key = key + self._META_SUFFIX
         if self._read_cache is not None and self._use_read_cache:
             metadata = self._read_cache.get(metadata_key)
@@ -545,7 +724,7 @@ class ReadCacheStorageBase(StorageBase):
                 if data:
                     return block, data, metadata
 
-        block, data, metadata = super()._read(block, metadata_only)
+        block, data, metadata = self._read_keys(block, key, metadata_key, metadata_only)
 
         # We always put blocks into the cache even when self._use_read_cache is False
         if self._read_cache is not None:
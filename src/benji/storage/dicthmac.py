@@ -1,7 +1,9 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
 import base64
+import hmac
 
+import orjson
 from Crypto.Hash import HMAC, SHA256
 
 from benji.exception import InternalError
@@ -15,12 +17,16 @@ class DictHMAC(ReprMixIn):
     _HASH_NAME = 'sha256'
     _HASH_MODULE = SHA256
 
+    # Digest calculated over the serialized dictionary instead of over its traversed keys and values
+    _SERIALIZED_HASH_NAME = 'sha256-serialized'
+
     _ALGORITHM_KEY = 'algorithm'
     _DIGEST_KEY = 'digest'
 
     def __init__(self, *, hmac_key, secret_key):
         self._hmac_key = hmac_key
         self._secret_key = secret_key
+        self._serialized_marker = ',"{}":'.format(hmac_key).encode(self._CHARSET)
 
     def _calculate_digest(self, dict_data: dict) -> str:
         hmac = HMAC.new(self._secret_key, digestmod=self._HASH_MODULE)
@@ -40,6 +46,10 @@ class DictHMAC(ReprMixIn):
 
         return base64.b64encode(hmac.digest()).decode('ascii')
 
+    def _calculate_serialized_digest(self, data: bytes) -> str:
+        return base64.b64encode(HMAC.new(self._secret_key, msg=data,
+                                         digestmod=self._HASH_MODULE).digest()).decode('ascii')
+
     def add_digest(self, dict_data: dict) -> None:
         if not isinstance(dict_data, dict):
             raise InternalError(f'dict_data must be of type dict, but is of type {type(dict_data)}')
@@ -49,6 +59,12 @@ class DictHMAC(ReprMixIn):
             self._DIGEST_KEY: self._calculate_digest(dict_data)
         }
 
+    # Constant time comparison, the expected digest comes from untrusted input and might not even be a string
+    @staticmethod
+    def _digests_equal(digest: str, digest_expected) -> bool:
+        return isinstance(digest_expected, str) and hmac.compare_digest(digest.encode('utf-8'),
+                                                                        digest_expected.encode('utf-8'))
+
     def verify_digest(self, dict_data) -> None:
         if not isinstance(dict_data, dict):
             raise InternalError(f'dict_data must be of type dict, but is of type {type(dict_data)}.')
@@ -70,5 +86,48 @@ class DictHMAC(ReprMixIn):
         digest_expected = hmac_dict[self._DIGEST_KEY]
         del dict_data[self._hmac_key]
         digest = self._calculate_digest(dict_data)
-        if digest != digest_expected:
+        if not self._digests_equal(digest, digest_expected):
             raise ValueError(f'Dictionary HMAC is invalid (expected {digest_expected}, actual {digest}).')
+
+    # The digest is calculated over the serialized JSON object and appended to it as its last key. This avoids
+    # traversing the dictionary and only needs one serialization pass.
+    def add_digest_serialized(self, data: bytes) -> bytes:
+        if not data.startswith(b'{') or not data.endswith(b'}') or len(data) < 3:
+            raise InternalError('data must be a serialized non-empty JSON object.')
+
+        hmac_json = orjson.dumps({
+            self._ALGORITHM_KEY: self._SERIALIZED_HASH_NAME,
+            self._DIGEST_KEY: self._calculate_serialized_digest(data),
+        })
+        return data[:-1] + self._serialized_marker + hmac_json + b'}'
+
+    # Returns the deserialized dictionary without the HMAC key. Dictionaries signed with add_digest() are supported
+    # as well.
+    def verify_digest_serialized(self, data: bytes) -> dict:
+        # The HMAC key is always the last key, so there is no need to parse the whole object to find it.
+        marker_position = data.rfind(self._serialized_marker)
+        if marker_position > 0:
+            try:
+                hmac_dict = orjson.loads(b'{' + data[marker_position + 1:])[self._hmac_key]
+            except (ValueError, KeyError):
+                hmac_dict = None
+
+            if isinstance(hmac_dict, dict) and hmac_dict.get(self._ALGORITHM_KEY) == self._SERIALIZED_HASH_NAME:
+                if self._DIGEST_KEY not in hmac_dict:
+                    raise ValueError(f'Required key {self._DIGEST_KEY} is missing in HMAC dictionary.')
+
+                digest_expected = hmac_dict[self._DIGEST_KEY]
+                data_signed = data[:marker_position] + b'}'
+                digest = self._calculate_serialized_digest(data_signed)
+                if not self._digests_equal(digest, digest_expected):
+                    raise ValueError(f'Dictionary HMAC is invalid (expected {digest_expected}, actual {digest}).')
+
+                # Only the signed part is deserialized
+                dict_data = orjson.loads(data_signed)
+                if not isinstance(dict_data, dict):
+                    raise ValueError(f'Serialized data is not a dictionary but of type {type(dict_data)}.')
+                return dict_data
+
+        dict_data = orjson.loads(data)
+        self.verify_digest(dict_data)
+        return dict_data
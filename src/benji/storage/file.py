@@ -2,6 +2,7 @@
 # -*- encoding: utf-8 -*-
 
 import os
+import threading
 from os.path import getsize
 from typing import Union, Iterable, Tuple
 
@@ -14,6 +15,8 @@ class Storage(StorageBase):
     WRITE_QUEUE_LENGTH = 10
     READ_QUEUE_LENGTH = 20
 
+    _COMPARE_CHUNK_SIZE = 64 * 1024
+
     def __init__(self, *, config: Config, name: str, module_configuration: ConfigDict):
         super().__init__(config=config, name=name, module_configuration=module_configuration)
 
@@ -26,6 +29,8 @@ class Storage(StorageBase):
         if not self.path.endswith(os.path.sep):
             self.path = os.path.join(self.path, '')
 
+        self._local = threading.local()
+
     def _write_object(self, key: str, data: bytes) -> None:
         filename = os.path.join(self.path, key)
 
@@ -58,6 +63,35 @@ class Storage(StorageBase):
 
         return os.path.getsize(filename)
 
+    def _compare_object(self, key: str, data_expected: bytes) -> bool:
+        filename = os.path.join(self.path, key)
+
+        if not os.path.exists(filename):
+            raise FileNotFoundError('File {} not found.'.format(filename))
+
+        if os.path.getsize(filename) != len(data_expected):
+            return False
+
+        # The chunk buffer is reused by each thread over all comparisons
+        try:
+            buffer_view = self._local.compare_buffer_view
+        except AttributeError:
+            buffer_view = self._local.compare_buffer_view = memoryview(bytearray(self._COMPARE_CHUNK_SIZE))
+
+        data_expected_view = memoryview(data_expected)
+        offset = 0
+        with open(filename, 'rb', buffering=0) as f:
+            while True:
+                length = f.readinto(buffer_view)
+                if not length:
+                    break
+                if offset + length > len(data_expected) or \
+                        data_expected_view[offset:offset + length] != buffer_view[:length]:
+                    return False
+                offset += length
+
+        return offset == len(data_expected)
+
     def _rm_object(self, key: str) -> None:
         filename = os.path.join(self.path, key)
 
@@ -65,19 +99,14 @@ class Storage(StorageBase):
             raise FileNotFoundError('File {} not found.'.format(filename))
         os.unlink(filename)
 
-    # def _rm_many_objects(self, keys: Sequence[str]) -> List[str]:
-    #     errors = []
-    #     for key in keys:
-    #         try:
-    #             self._rm_object(key)
-    #         except FileNotFoundError:
-    #             errors.append(key)
-    #     return errors
-
-    def _list_objects(self, prefix: str = None,
-                      include_size: bool = False) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
+    def _list_objects(self,
+                      prefix: str = None,
+                      include_size: bool = False,
+                      exclude_suffix: str = None) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
         for root, dirnames, filenames in os.walk(os.path.join(self.path, prefix) if prefix is not None else self.path):
             for filename in filenames:
+                if exclude_suffix is not None and filename.endswith(exclude_suffix):
+                    continue
                 key = (os.path.join(root, filename))[len(self.path):]
                 if include_size:
                     try:
@@ -1,9 +1,26 @@
 import hashlib
 from abc import ABCMeta, abstractmethod
-from typing import TypeVar, Generic
+from typing import TypeVar, Generic, Callable, Dict
+
+try:
+    import xxhash
+except ImportError:
+    _HAS_XXHASH = False
+else:
+    _HAS_XXHASH = True
 
 StorageObject = TypeVar('StorageObject')
 
+DEFAULT_SHARDING_HASH = 'md5'
+
+# The sharding hash is only used to distribute the keys over the first two directory levels, it doesn't need
+# to be a cryptographic hash. Changing it for an existing storage makes existing objects inaccessible.
+SHARDING_HASHES: Dict[str, Callable[[str], str]] = {
+    'md5': lambda key: hashlib.md5(key.encode('ascii')).hexdigest(),
+}
+if _HAS_XXHASH:
+    SHARDING_HASHES['xxh3'] = lambda key: xxhash.xxh3_64_hexdigest(key.encode('ascii'))
+
 
 class StorageKeyMixIn(Generic[StorageObject], metaclass=ABCMeta):
 
@@ -22,21 +39,22 @@ class StorageKeyMixIn(Generic[StorageObject], metaclass=ABCMeta):
         raise NotImplementedError
 
     @staticmethod
-    def _to_path(prefix: str, key: str) -> str:
-        digest = hashlib.md5(key.encode('ascii')).hexdigest()
-        return '{}{}/{}/{}'.format(prefix, digest[0:2], digest[2:4], key)
+    def _to_path(prefix: str, key: str, sharding_hash: str = DEFAULT_SHARDING_HASH) -> str:
+        digest = SHARDING_HASHES[sharding_hash](key)
+        return f'{prefix}{digest[0:2]}/{digest[2:4]}/{key}'
 
     @staticmethod
     def _from_path(prefix: str, key: str) -> str:
         if not key.startswith(prefix):
             raise RuntimeError('Invalid key name {}, it doesn\'t start with "{}".'.format(key, prefix))
-        pl = len(prefix)
-        if len(key) <= (pl + 6):
-            raise RuntimeError('Key {} has an invalid length, expected at least {} characters.'.format(key, pl + 6))
-        return key[pl + 6:]
-
-    def storage_object_to_path(self) -> str:
-        return self._to_path(self.storage_prefix(), self._storage_object_to_key())
+        # Skip the prefix and the two sharding levels
+        offset = len(prefix) + 6
+        if len(key) <= offset:
+            raise RuntimeError('Key {} has an invalid length, expected at least {} characters.'.format(key, offset))
+        return key[offset:]
+
+    def storage_object_to_path(self, sharding_hash: str = DEFAULT_SHARDING_HASH) -> str:
+        return self._to_path(self.storage_prefix(), self._storage_object_to_key(), sharding_hash)
 
     @classmethod
     def storage_path_to_object(cls, path: str) -> StorageObject:
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 # -*- encoding: utf-8 -*-
+import hashlib
 import threading
-from typing import Iterable, Union, Tuple
+from typing import Iterable, Union, Tuple, Sequence, List
 
 import boto3
 from botocore.client import Config as BotoCoreClientConfig
@@ -18,6 +19,8 @@ class Storage(ReadCacheStorageBase):
     WRITE_QUEUE_LENGTH = 20
     READ_QUEUE_LENGTH = 20
 
+    _CONCURRENT_OBJECT_PAIR_READS = True
+
     def __init__(self, *, config: Config, name: str, module_configuration: ConfigDict):
         aws_access_key_id = Config.get_from_dict(module_configuration, 'awsAccessKeyId', None, types=str)
         if aws_access_key_id is None:
@@ -108,6 +111,27 @@ class Storage(ReadCacheStorageBase):
 
         return object.content_length
 
+    def _compare_object(self, key: str, data_expected: bytes) -> bool:
+        self._init_connection()
+        object = self._local.bucket.Object(key)
+        try:
+            object.load()
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'NoSuchKey' or e.response['Error']['Code'] == '404':
+                raise FileNotFoundError('Key {} not found.'.format(key)) from None
+            else:
+                raise
+
+        if object.content_length != len(data_expected):
+            return False
+
+        # The ETag is the MD5 digest of the object's content for objects uploaded with a single PUT request unless
+        # SSE-C or SSE-KMS are used. In all other cases fall back to reading the object.
+        if object.e_tag.strip('"') == hashlib.md5(data_expected).hexdigest():
+            return True
+
+        return super()._compare_object(key, data_expected)
+
     def _rm_object(self, key):
         self._init_connection()
         # delete() always returns 204 even when key doesn't exist, so check for existence
@@ -122,32 +146,29 @@ class Storage(ReadCacheStorageBase):
         else:
             object.delete()
 
-    # def _rm_many_objects(self, keys: Sequence[str]) -> List[str]:
-    #     self._init_connection()
-    #     errors: List[str] = []
-    #     if self._multi_delete:
-    #         # Amazon (at least) only handles 1000 deletes at a time
-    #         # Split list into parts of at most 1000 elements
-    #         keys_parts = [islice(keys, i, i + 1000) for i in range(0, len(keys), 1000)]
-    #         for part in keys_parts:
-    #             response = self._local.resource.meta.client.delete_objects(
-    #                 Bucket=self._local.bucket.name, Delete={
-    #                     'Objects': [{
-    #                         'Key': key
-    #                     } for key in part],
-    #                 })
-    #             if 'Errors' in response:
-    #                 errors += list(map(lambda object: object['Key'], response['Errors']))
-    #     else:
-    #         for key in keys:
-    #             try:
-    #                 self._local.bucket.Object(key).delete()
-    #             except ClientError:
-    #                 errors.append(key)
-    #     return errors
-
-    def _list_objects(self, prefix: str = None,
-                      include_size: bool = False) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
+    # In contrast to _rm_object() keys which don't exist are not detected here, DeleteObjects reports them as deleted.
+    # Checking for their existence would defeat the purpose of removing many objects with one request.
+    def _rm_many_objects(self, keys: Sequence[str]) -> List[str]:
+        self._init_connection()
+        errors: List[str] = []
+        # DeleteObjects handles at most 1000 keys per request. rm_many_blocks() passes chunks of at most this size
+        # (see _RM_MANY_OBJECTS_CHUNK_SIZE), so usually there is only one part.
+        keys_parts = [keys[i:i + 1000] for i in range(0, len(keys), 1000)]
+        for part in keys_parts:
+            response = self._local.resource.meta.client.delete_objects(Bucket=self._local.bucket.name,
+                                                                       Delete={
+                                                                           'Objects': [{
+                                                                               'Key': key
+                                                                           } for key in part],
+                                                                       })
+            if 'Errors' in response:
+                errors += [error['Key'] for error in response['Errors']]
+        return errors
+
+    def _list_objects(self,
+                      prefix: str = None,
+                      include_size: bool = False,
+                      exclude_suffix: str = None) -> Union[Iterable[str], Iterable[Tuple[str, int]]]:
         self._init_connection()
 
         if prefix is None:
@@ -156,6 +177,8 @@ class Storage(ReadCacheStorageBase):
             objects_iterable = self._local.bucket.objects.filter(Prefix=prefix)
 
         for object_summary in objects_iterable:
+            if exclude_suffix is not None and object_summary.key.endswith(exclude_suffix):
+                continue
             if include_size:
                 yield object_summary.key, object_summary.size
             else:
@@ -1,8 +1,12 @@
+import itertools
 import random
+from concurrent.futures import TimeoutError
+from unittest import mock
 
 from benji.database import Block, BlockUid, VersionUid
 from benji.logging import logger
 from benji.storage.base import InvalidBlockException, BlockNotFoundError
+from benji.storage.key import SHARDING_HASHES
 from benji.tests.testcase import StorageTestCaseBase
 
 
@@ -90,6 +94,149 @@ class StorageTestCase(StorageTestCaseBase):
         saved_uids = list(self.storage.list_blocks())
         self.assertEqual(0, len(saved_uids))
 
+    def test_rm_many_blocks(self):
+        NUM_BLOBS = 15
+        BLOB_SIZE = 4096
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100), size=BLOB_SIZE, checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        for block in blocks:
+            self.storage.write_block(block, self.random_bytes(BLOB_SIZE))
+
+        saved_uids = list(self.storage.list_blocks())
+        self.assertEqual(NUM_BLOBS, len(saved_uids))
+
+        self.assertEqual([], self.storage.rm_many_blocks([block.uid for block in blocks]))
+
+        saved_uids = list(self.storage.list_blocks())
+        self.assertEqual(0, len(saved_uids))
+
+        objects_count, _ = self.storage.storage_stats()
+        self.assertEqual(0, objects_count)
+
+    def _write_blocks_async_failing_checks(self, blocks, data_size, timeout=None):
+        with mock.patch.object(self.storage, '_compare_object', return_value=False):
+            for block in blocks:
+                self.storage.write_block_async(block, self.random_bytes(block.size if data_size is None else data_size))
+
+            written_uids, failed_uids = set(), set()
+            while len(written_uids) + len(failed_uids) < len(blocks):
+                try:
+                    for result in self.storage.write_get_completed(timeout=timeout):
+                        if isinstance(result, InvalidBlockException):
+                            failed_uids.add(result.block.uid)
+                        else:
+                            self.assertNotIsInstance(result, BaseException)
+                            written_uids.add(result.uid)
+                except TimeoutError:
+                    pass
+
+        self.storage.wait_writes_finished()
+        self.assertEqual([], list(self.storage.write_get_completed(timeout=1)))
+        # Every block is either reported as written or as failed, but never both
+        self.assertEqual(set(), written_uids & failed_uids)
+        self.assertEqual({block.uid for block in blocks}, written_uids | failed_uids)
+
+        for block in blocks:
+            self.storage.rm_block(block.uid)
+
+        return written_uids, failed_uids
+
+    def _check_writes_enabled(self):
+        if not self.storage._consistency_check_writes:
+            self.skipTest('Consistency checks of writes are not enabled for this storage.')
+
+    def test_check_writes_failure(self):
+        self._check_writes_enabled()
+        NUM_BLOBS = 15
+        BLOB_SIZE = 4096
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100), size=BLOB_SIZE, checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        written_uids, failed_uids = self._write_blocks_async_failing_checks(blocks, BLOB_SIZE)
+        self.assertEqual(set(), written_uids)
+        self.assertEqual(NUM_BLOBS, len(failed_uids))
+
+    def test_check_writes_failure_timeout(self):
+        self._check_writes_enabled()
+        NUM_BLOBS = 15
+        BLOB_SIZE = 4096
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100), size=BLOB_SIZE, checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        written_uids, failed_uids = self._write_blocks_async_failing_checks(blocks, BLOB_SIZE, timeout=0)
+        self.assertEqual(set(), written_uids)
+        self.assertEqual(NUM_BLOBS, len(failed_uids))
+
+    def test_check_writes_sample(self):
+        self._check_writes_enabled()
+        NUM_BLOBS = 16
+        BLOB_SIZE = 4096
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100), size=BLOB_SIZE, checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        with mock.patch.object(self.storage, '_consistency_check_writes_sample', 0.5), \
+                mock.patch('benji.storage.base.random.random', side_effect=itertools.cycle([0.25, 0.75])):
+            written_uids, failed_uids = self._write_blocks_async_failing_checks(blocks, BLOB_SIZE, timeout=0)
+        # Only the sampled writes are checked and so only these fail
+        self.assertEqual(NUM_BLOBS // 2, len(written_uids))
+        self.assertEqual(NUM_BLOBS // 2, len(failed_uids))
+
+    def test_check_writes_minimum_size(self):
+        self._check_writes_enabled()
+        NUM_BLOBS = 10
+        SMALL_BLOB_SIZE = 1024
+        LARGE_BLOB_SIZE = 16384
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100),
+                  size=SMALL_BLOB_SIZE if i % 2 == 0 else LARGE_BLOB_SIZE,
+                  checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        with mock.patch.object(self.storage, '_consistency_check_writes_minimum_size', 8192):
+            written_uids, failed_uids = self._write_blocks_async_failing_checks(blocks, None)
+        self.assertEqual({block.uid for block in blocks if block.size == SMALL_BLOB_SIZE}, written_uids)
+        self.assertEqual({block.uid for block in blocks if block.size == LARGE_BLOB_SIZE}, failed_uids)
+
+    def test_rm_many_blocks_chunks(self):
+        NUM_BLOBS = 600
+        BLOB_SIZE = 16
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100), size=BLOB_SIZE, checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        for block in blocks:
+            self.storage.write_block(block, self.random_bytes(BLOB_SIZE))
+
+        # More than 1000 keys split into many small chunks which are removed concurrently
+        with mock.patch.object(self.storage, '_RM_MANY_OBJECTS_CHUNK_SIZE', 7):
+            self.assertEqual([], self.storage.rm_many_blocks([block.uid for block in blocks]))
+
+        objects_count, _ = self.storage.storage_stats()
+        self.assertEqual(0, objects_count)
+
+    def test_rm_many_blocks_missing_metadata(self):
+        NUM_BLOBS = 5
+        BLOB_SIZE = 4096
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100), size=BLOB_SIZE, checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        for block in blocks:
+            self.storage.write_block(block, self.random_bytes(BLOB_SIZE))
+        key = blocks[0].uid.storage_object_to_path(self.storage._sharding_hash)
+        self.storage._rm_object(key + self.storage._META_SUFFIX)
+
+        # The missing metadata object is only logged
+        self.assertEqual([], self.storage.rm_many_blocks([block.uid for block in blocks]))
+
+        objects_count, _ = self.storage.storage_stats()
+        self.assertEqual(0, objects_count)
+
     def test_not_exists(self):
         block = Block(uid=BlockUid(1, 2), size=15, checksum='00000000000000000000')
         self.storage.write_block(block, b'test_not_exists')
@@ -102,6 +249,16 @@ class StorageTestCase(StorageTestCaseBase):
         self.assertRaises(BlockNotFoundError, lambda: self.storage.rm_block(block.uid))
         self.assertRaises(InvalidBlockException, lambda: self.storage.read_block(block))
 
+    def test_object_metadata_version(self):
+        block = Block(uid=BlockUid(1, 2), size=4096, checksum='0000000000000000')
+        self.storage.write_block(block, self.random_bytes(4096))
+
+        self.storage.read_block_async(block, metadata_only=True)
+        _, _, metadata = next(self.storage.read_get_completed())
+        self.assertEqual('3.0.0' if self.storage._dict_hmac else '2.0.0', metadata['metadata_version'])
+
+        self.storage.rm_block(block.uid)
+
     def test_block_uid_to_key(self):
         for i in range(100):
             block_uid = BlockUid(random.randint(1, pow(2, 32) - 1), random.randint(1, pow(2, 32) - 1))
@@ -111,6 +268,12 @@ class StorageTestCase(StorageTestCaseBase):
             self.assertEqual(block_uid.left, block_uid_2.left)
             self.assertEqual(block_uid.right, block_uid_2.right)
 
+    def test_block_uid_to_key_sharding_hashes(self):
+        block_uid = BlockUid(random.randint(1, pow(2, 32) - 1), random.randint(1, pow(2, 32) - 1))
+        for sharding_hash in SHARDING_HASHES.keys():
+            key = block_uid.storage_object_to_path(sharding_hash)
+            self.assertEqual(block_uid, BlockUid.storage_path_to_object(key))
+
     def test_version_uid_to_key(self):
         for i in range(100):
             version_uid = VersionUid('v{}'.format(random.randint(1, pow(2, 32) - 1)))
@@ -1,5 +1,7 @@
 from unittest import TestCase
 
+from benji.database import Block, BlockUid
+from benji.tests.testcase import StorageTestCaseBase
 from . import StorageTestCase
 
 
@@ -25,3 +27,71 @@ class StorageTestFile(StorageTestCase, TestCase):
             - name: file
               module: file              
         """
+
+
+class StorageTestFileTransformWorkers(StorageTestCaseBase, TestCase):
+    CONFIG = """
+        configurationVersion: '1'
+        logFile: /dev/stderr
+        databaseEngine: sqlite://
+        defaultStorage: storage-1
+
+        storages:
+          - name: storage-1
+            module: file
+            configuration:
+              path: {testpath}/data
+              transformWorkers: 2
+              activeTransforms:
+                - zstd
+                - k1
+
+        transforms:
+          - name: zstd
+            module: zstd
+            configuration:
+              level: 1
+          - name: k1
+            module: aes_256_gcm
+            configuration:
+              masterKey: VPSQYIyD+dfLIRBTYJlGziu1hsT2eNFXnEuvl6jM/m8=
+
+        ios:
+            - name: file
+              module: file
+        """
+
+    def test_write_read_transform_workers(self):
+        NUM_BLOBS = 10
+        # Large enough to be transformed by the worker processes
+        BLOB_SIZE = 256 * 1024
+
+        self.assertIsNotNone(self.storage._transform_executor)
+
+        blocks = [
+            Block(uid=BlockUid(i + 1, i + 100), size=BLOB_SIZE, checksum='0000000000000000') for i in range(NUM_BLOBS)
+        ]
+        data_by_uid = {}
+        for i, block in enumerate(blocks):
+            # Half of the blocks are compressible
+            data = b'\0' * BLOB_SIZE if i % 2 == 0 else self.random_bytes(BLOB_SIZE)
+            self.storage.write_block_async(block, data)
+            data_by_uid[block.uid] = data
+
+        self.storage.wait_writes_finished()
+        for result in self.storage.write_get_completed(timeout=1):
+            self.assertNotIsInstance(result, BaseException)
+
+        for block in blocks:
+            self.storage.read_block_async(block)
+
+        for result in self.storage.read_get_completed(timeout=5):
+            self.assertNotIsInstance(result, BaseException)
+            block, data, metadata = result
+            self.assertEqual(data_by_uid[block.uid], data)
+            self.assertEqual(['zstd', 'k1'] if data == b'\0' * BLOB_SIZE else ['k1'],
+                             [transform['name'] for transform in metadata['transforms']])
+
+        for block in blocks:
+            self.assertEqual(data_by_uid[block.uid], self.storage.read_block(block))
+            self.storage.rm_block(block.uid)
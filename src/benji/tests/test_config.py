@@ -167,10 +167,14 @@ class ConfigTestCase(TestCaseBase, TestCase):
                 'bandwidthRead': 0,
                 'bandwidthWrite': 0,
                 'consistencyCheckWrites': False,
+                'consistencyCheckWritesMinimumSize': 0,
+                'consistencyCheckWritesSample': 1.0,
                 'path': '/var/tmp',
                 'simultaneousReads': 3,
                 'simultaneousWrites': 3,
                 'simultaneousRemovals': 5,
+                'shardingHash': 'md5',
+                'transformWorkers': 0,
             }, config.validate(module='benji.storage.file', config=module_configuration))
         module_configuration = {'asdasdas': 'dasdasd'}
         self.assertRaises(ConfigurationError,
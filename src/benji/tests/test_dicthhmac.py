@@ -1,5 +1,7 @@
 from unittest import TestCase
 
+import orjson
+
 from benji.exception import InternalError
 from benji.storage.dicthmac import DictHMAC
 
@@ -61,3 +63,36 @@ class DictHMACHashTestCase(TestCase):
     def test_wrong_hmac_type(self):
         self.data['hmac'] = 1
         self.assertRaises(ValueError, lambda: self.dh.verify_digest(self.data))
+
+    def test_serialized_verify(self):
+        data = orjson.dumps({'a': 10, 'b': 'test', 'c': True, 'e': {'a': 1, 'b': 'test'}})
+        data_signed = self.dh.add_digest_serialized(data)
+        self.assertDictEqual({
+            'a': 10,
+            'b': 'test',
+            'c': True,
+            'e': {
+                'a': 1,
+                'b': 'test'
+            }
+        }, self.dh.verify_digest_serialized(data_signed))
+
+    def test_serialized_invalid_digest(self):
+        data_signed = self.dh.add_digest_serialized(orjson.dumps({'a': 10, 'b': 'test'}))
+        data_signed = data_signed.replace(b'"test"', b'"tset"')
+        self.assertRaises(ValueError, lambda: self.dh.verify_digest_serialized(data_signed))
+
+    def test_serialized_missing_hmac(self):
+        self.assertRaises(ValueError, lambda: self.dh.verify_digest_serialized(orjson.dumps({'a': 10, 'b': 'test'})))
+
+    def test_serialized_legacy(self):
+        data = self.data.copy()
+        self.assertDictEqual({
+            'a': 10,
+            'b': 'test',
+            'c': True,
+            'e': {
+                'a': 1,
+                'b': 'test'
+            }
+        }, self.dh.verify_digest_serialized(orjson.dumps(data)))
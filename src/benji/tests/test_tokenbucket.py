@@ -0,0 +1,39 @@
+import time
+from unittest import TestCase
+
+from benji.utils import BlockingTokenBucket
+
+
+class BlockingTokenBucketTestCase(TestCase):
+
+    def test_unlimited(self):
+        bucket = BlockingTokenBucket()
+        bucket.set_rate(0)
+        t1 = time.time()
+        for _ in range(1000):
+            bucket.acquire(1024 * 1024)
+        self.assertLess(time.time() - t1, 1)
+
+    def test_within_capacity(self):
+        bucket = BlockingTokenBucket()
+        bucket.set_rate(1000)
+        t1 = time.time()
+        bucket.acquire(500)
+        bucket.acquire(500)
+        self.assertLess(time.time() - t1, 0.5)
+
+    def test_blocks(self):
+        bucket = BlockingTokenBucket()
+        bucket.set_rate(1000)
+        t1 = time.time()
+        bucket.acquire(1000)
+        bucket.acquire(500)
+        self.assertGreaterEqual(time.time() - t1, 0.45)
+
+    def test_larger_than_capacity(self):
+        bucket = BlockingTokenBucket()
+        bucket.set_rate(1000)
+        t1 = time.time()
+        bucket.acquire(2000)
+        bucket.acquire(1)
+        self.assertGreaterEqual(time.time() - t1, 0.95)
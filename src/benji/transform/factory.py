@@ -56,7 +56,9 @@ class TransformFactory(ReprMixIn):
 
     @classmethod
     def initialize(cls, config: Config) -> None:
+        # Instances created with a previous configuration must not be reused
         cls._modules = {}
+        cls._instances = {}
         transforms: ConfigList = config.get('transforms', None, types=list)
         if transforms is not None:
             cls._import_modules(config, transforms)
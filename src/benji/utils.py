@@ -10,7 +10,7 @@ from ast import literal_eval
 from concurrent.futures import Future
 from datetime import datetime
 from importlib import import_module
-from threading import Lock
+from threading import Lock, Condition
 from time import time
 from typing import List, Tuple, Union, Any, Optional, Dict, Iterator
 
@@ -144,41 +144,46 @@ class PrettyPrint:
             return date.astimezone(tz.tzlocal()).strftime("%Y-%m-%dT%H:%M:%S")
 
 
-class TokenBucket:
+class BlockingTokenBucket:
     """
-    An implementation of the token bucket algorithm.
+    An implementation of the token bucket algorithm. acquire() blocks the calling thread until enough tokens are
+    available. The bucket's capacity is equal to its rate, so short bursts of up to one second worth of tokens are
+    permitted.
     """
 
+    # Maximum fraction of the wait time added as random jitter to keep waiting threads from waking up in lock-step
+    _JITTER = 0.1
+
     def __init__(self) -> None:
-        self.tokens = 0.0
-        self.rate = 0
-        self.last = time()
-        self.lock = Lock()
+        self._tokens = 0.0
+        self._rate = 0
+        self._last = time()
+        self._condition = Condition(Lock())
 
     def set_rate(self, rate: int) -> None:
-        with self.lock:
-            self.rate = rate
-            self.tokens = self.rate
-
-    def consume(self, tokens: int) -> float:
-        with self.lock:
-            if not self.rate:
-                return 0
-
-            now = time()
-            lapse = now - self.last
-            self.last = now
-            self.tokens += lapse * self.rate
-
-            if self.tokens > self.rate:
-                self.tokens = self.rate
-
-            self.tokens -= tokens
-
-            if self.tokens >= 0:
-                return 0
-            else:
-                return -self.tokens / self.rate
+        with self._condition:
+            self._rate = rate
+            self._tokens = float(rate)
+            self._last = time()
+            self._condition.notify_all()
+
+    def _refill(self) -> None:
+        now = time()
+        self._tokens = min(self._tokens + (now - self._last) * self._rate, float(self._rate))
+        self._last = now
+
+    def acquire(self, tokens: int) -> None:
+        with self._condition:
+            while self._rate:
+                self._refill()
+                # Requests larger than the capacity of the bucket would never be fulfilled otherwise. Such a request
+                # is granted when the bucket is full and leaves it in debt, which later requests have to wait out.
+                needed = min(tokens, self._rate)
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    break
+                wait_time = (needed - self._tokens) / self._rate
+                self._condition.wait(wait_time * (1 + random.uniform(0, self._JITTER)))
 
 
 class InputValidation: